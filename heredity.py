@@ -1,6 +1,11 @@
+import concurrent.futures
 import csv
+import functools
 import itertools
+import math
+import os
 import sys
+from fractions import Fraction
 
 PROBS = {
 
@@ -36,6 +41,78 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Unconditional probability of each gene count, PRIOR[genes]
+PRIOR = tuple(PROBS["gene"][genes] for genes in (0, 1, 2))
+
+# Probability of each trait given the gene count, TRAIT[genes][trait]
+TRAIT = tuple(
+    (PROBS["trait"][genes][False], PROBS["trait"][genes][True])
+    for genes in (0, 1, 2)
+)
+
+# Probability that a parent passes the gene on, by the parent's gene count
+PASS = (
+    PROBS["mutation"],
+    0.5,
+    1 - PROBS["mutation"]
+)
+
+# Probability of a child's gene count, INHERIT[mother's][father's][child's]
+INHERIT = tuple(
+    tuple(
+        (
+            (1 - from_mother) * (1 - from_father),
+            from_mother * (1 - from_father) + from_father * (1 - from_mother),
+            from_mother * from_father
+        )
+        for from_father in PASS
+    )
+    for from_mother in PASS
+)
+
+# The same tables as log-probabilities, for summing instead of multiplying;
+# impossible outcomes get -inf, which math.exp turns back into 0
+LOG_PRIOR = tuple(math.log(p) if p else -math.inf for p in PRIOR)
+LOG_TRAIT = tuple(
+    tuple(math.log(p) if p else -math.inf for p in row)
+    for row in TRAIT
+)
+LOG_INHERIT = tuple(
+    tuple(tuple(math.log(p) if p else -math.inf for p in child) for child in row)
+    for row in INHERIT
+)
+
+# The same probabilities as exact fractions, read from their decimal form
+EXACT_PRIOR = tuple(Fraction(str(p)) for p in PRIOR)
+EXACT_TRAIT = tuple(tuple(Fraction(str(p)) for p in row) for row in TRAIT)
+EXACT_MUTATION = Fraction(str(PROBS["mutation"]))
+EXACT_PASS = (EXACT_MUTATION, Fraction(1, 2), 1 - EXACT_MUTATION)
+
+# Smallest number that turns every exact probability into a whole number
+SCALE = math.lcm(*(
+    p.denominator
+    for p in (*EXACT_PRIOR, *EXACT_TRAIT[0], *EXACT_TRAIT[1], *EXACT_TRAIT[2],
+              *EXACT_PASS)
+))
+
+# The same tables as whole numbers, for exact arithmetic: PRIOR_SCALED,
+# TRAIT_SCALED and PASS_SCALED count 1/SCALE and INHERIT_SCALED counts
+# 1/SCALE**2, since it multiplies two pass probabilities
+PRIOR_SCALED = tuple(int(p * SCALE) for p in EXACT_PRIOR)
+TRAIT_SCALED = tuple(tuple(int(p * SCALE) for p in row) for row in EXACT_TRAIT)
+PASS_SCALED = tuple(int(p * SCALE) for p in EXACT_PASS)
+INHERIT_SCALED = tuple(
+    tuple(
+        (
+            (SCALE - from_mother) * (SCALE - from_father),
+            from_mother * (SCALE - from_father) + from_father * (SCALE - from_mother),
+            from_mother * from_father
+        )
+        for from_father in PASS_SCALED
+    )
+    for from_mother in PASS_SCALED
+)
+
 
 def main():
 
@@ -44,45 +121,8 @@ def main():
         sys.exit("Usage: python heredity.py data.csv")
     people = load_data(sys.argv[1])
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
-        }
-        for person in people
-    }
-
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
-
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
-
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
-
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+    # Compute gene and trait distributions for each person
+    probabilities = variable_elimination(people)
 
     # Print results
     for person in people:
@@ -101,36 +141,360 @@ def load_data(filename):
     mother, father must both be blank, or both be valid names in the CSV.
     trait should be 0 or 1 if trait is known, blank otherwise.
     """
+    traits = {"1": True, "0": False, "": None}
     data = dict()
     with open(filename) as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        header = next(reader)
+        name_col, mother_col, father_col, trait_col = (
+            header.index(field) for field in ("name", "mother", "father", "trait")
+        )
         for row in reader:
-            name = row["name"]
+
+            # Skip blank lines and read missing trailing fields as blank,
+            # as csv.DictReader does
+            if not row:
+                continue
+            row += [""] * (len(header) - len(row))
+
+            name = row[name_col]
             data[name] = {
                 "name": name,
-                "mother": row["mother"] or None,
-                "father": row["father"] or None,
-                "trait": (True if row["trait"] == "1" else
-                          False if row["trait"] == "0" else None)
+                "mother": row[mother_col] or None,
+                "father": row[father_col] or None,
+                "trait": traits.get(row[trait_col])
             }
     return data
 
 
-def powerset(s):
+def enumeration(people, workers=1):
+    """
+    Compute gene and trait distributions for each person by summing the
+    joint probability of every possible assignment of genes and traits.
+    Exponential in the number of people; kept as the reference answer
+    for `variable_elimination`.
+
+    With more than one worker, the assignments are split between that many
+    processes and their totals added together at the end. `workers=None`
+    starts one process per CPU, which only pays off on larger pedigrees.
+    """
+    # Leave barren people out of the enumeration entirely
+    barren = barren_people(people)
+    core = {person: people[person] for person in people if person not in barren}
+
+    # Look up everyone's parents by position once, up front
+    order, mothers, fathers = index_people(core)
+    n = len(order)
+    position = {person: i for i, person in enumerate(order)}
+    barren_parents = [
+        (position[people[person]["mother"]], position[people[person]["father"]])
+        for person in barren if people[person]["mother"] is not None
+    ]
+    everyone = (1 << n) - 1
+
+    # Sets of people are bitmasks over positions in `order`
+    required_known, required_true = evidence_masks(core, order)
+
+    # Every set of people who might have the trait,
+    # only varying the people whose trait is not known
+    trait_sets = [
+        [(required_true | ht_sub) >> i & 1 for i in range(n)]
+        for ht_sub in submasks(everyone & ~required_known)
+    ]
+
+    # Deal out sets of people with one gene round-robin, since sets
+    # with fewer people leave more choices for who has two genes
+    if workers is None:
+        workers = os.cpu_count() or 1
+    shards = [powerset(n)[k::workers] for k in range(workers)]
+    totals = functools.partial(
+        shard_totals, mothers, fathers, trait_sets, barren_parents
+    )
+    if workers == 1:
+        results = map(totals, shards)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(totals, shards))
+
+    # Running totals by position: gene_probs[i][genes], trait_probs[i][trait]
+    gene_probs = [[0, 0, 0] for _ in range(n)]
+    trait_probs = [[0, 0] for _ in range(n)]
+    barren_probs = [[0, 0, 0] for _ in barren_parents]
+    for shard_gene_probs, shard_trait_probs, shard_barren_probs in results:
+        for i in range(n):
+            for value in (0, 1, 2):
+                gene_probs[i][value] += shard_gene_probs[i][value]
+            for value in (0, 1):
+                trait_probs[i][value] += shard_trait_probs[i][value]
+        for j in range(len(barren_parents)):
+            for value in (0, 1, 2):
+                barren_probs[j][value] += shard_barren_probs[j][value]
+
+    # Barren people without parents just follow the unconditional
+    # distribution, and anyone barren has an unobserved trait
+    barren_probs = iter(barren_probs)
+    for person in barren:
+        if people[person]["mother"] is None:
+            gene = list(PRIOR)
+        else:
+            gene = next(barren_probs)
+        trait = [
+            sum(gene[g] * TRAIT[g][value] for g in (0, 1, 2))
+            for value in (False, True)
+        ]
+        order.append(person)
+        gene_probs.append(gene)
+        trait_probs.append(trait)
+
+    # Ensure probabilities sum to 1, and key them by name again
+    probabilities = dict()
+    for person, gene, trait in zip(order, gene_probs, trait_probs):
+        gene_total = sum(gene)
+        trait_total = sum(trait)
+        probabilities[person] = {
+            "gene": {value: gene[value] / gene_total for value in (2, 1, 0)},
+            "trait": {
+                value: trait[value] / trait_total for value in (True, False)
+            }
+        }
+    return probabilities
+
+
+def shard_totals(mothers, fathers, trait_sets, barren_parents, one_gene_sets):
+    """
+    Sum the joint probability of every assignment whose set of people
+    with one gene is in `one_gene_sets`, for `enumeration`.
+    Return running totals by position, gene_probs[i][genes] and
+    trait_probs[i][trait], along with barren_probs[j][genes] for the
+    barren child whose parents' positions are `barren_parents[j]`.
+    """
+    n = len(mothers)
+    everyone = (1 << n) - 1
+    gene_probs = [[0, 0, 0] for _ in range(n)]
+    trait_probs = [[0, 0] for _ in range(n)]
+    barren_probs = [[0, 0, 0] for _ in barren_parents]
+
+    # Totals are only ever normalized, so divide every joint probability
+    # by that of a likely assignment (nobody has the gene) to keep them
+    # away from underflow; every shard computes the same constant
+    no_genes = [0] * n
+    shift = log_gene_probability(mothers, fathers, no_genes) + max(
+        (log_trait_probability(no_genes, traits) for traits in trait_sets),
+        default=0
+    )
+    if shift == -math.inf:
+        # That assignment is impossible, so don't shift at all
+        shift = 0
+
+    # Loop over all sets of people who might have the gene, walking the
+    # subsets of everyone else for two genes inline, as in `submasks`
+    for one_gene in one_gene_sets:
+        rest = everyone & ~one_gene
+        two_genes = rest
+        while True:
+            genes = [
+                (one_gene >> i & 1) + 2 * (two_genes >> i & 1)
+                for i in range(n)
+            ]
+
+            # The gene part of the joint probability is shared by
+            # every set of people who might have the trait
+            log_p_genes = log_gene_probability(mothers, fathers, genes)
+            gene_total = 0
+            for traits in trait_sets:
+
+                # Update probabilities with new joint probability
+                log_p = log_p_genes + log_trait_probability(genes, traits)
+                p = math.exp(log_p - shift)
+                gene_total += p
+                for i in range(n):
+                    trait_probs[i][traits[i]] += p
+
+            for i in range(n):
+                gene_probs[i][genes[i]] += gene_total
+
+            # Barren children just inherit from parents in this assignment
+            for j, (mother, father) in enumerate(barren_parents):
+                inherit = INHERIT[genes[mother]][genes[father]]
+                for value in (0, 1, 2):
+                    barren_probs[j][value] += gene_total * inherit[value]
+
+            if two_genes == 0:
+                break
+            two_genes = (two_genes - 1) & rest
+
+    return gene_probs, trait_probs, barren_probs
+
+
+def variable_elimination(people):
+    """
+    Compute gene and trait distributions for each person by variable
+    elimination over the pedigree.
+
+    Each person contributes one factor over their own gene count and their
+    parents' gene counts, with an observed trait folded in. For every
+    person, all other gene variables are summed out one at a time, so the
+    work grows with the size of the largest intermediate factor rather
+    than with 3^N. Unobserved traits sum to 1 and are recovered at the end
+    from the gene distribution. Barren people's factors would sum out to 1,
+    so they are only included when asking about that person.
+
+    Factors hold whole numbers (see `person_factor`), so every sum and
+    product is exact and rounding only happens in the final normalization.
+    """
+    barren = barren_people(people)
+    core = [person for person in people if person not in barren]
+    factors = [person_factor(people, person) for person in core]
+
+    probabilities = dict()
+    for person in people:
+
+        # Sum out everyone else, always picking the variable whose
+        # elimination creates the smallest new factor
+        remaining = factors
+        if person in barren:
+            remaining = factors + [person_factor(people, person)]
+        others = [other for other in core if other != person]
+        while others:
+            other = min(others, key=lambda v: len(factor_scope(remaining, v)))
+            others.remove(other)
+            remaining = eliminate(remaining, other)
+
+        # Multiply what is left into a distribution over `person`
+        gene = dict()
+        for value in (2, 1, 0):
+            gene[value] = 1
+            for variables, table in remaining:
+                gene[value] *= table[(value,) * len(variables)]
+
+        # Observed traits are certain; otherwise marginalize over genes
+        trait = people[person]["trait"]
+        if trait is None:
+            trait_dist = {
+                value: sum(gene[g] * TRAIT_SCALED[g][value] for g in gene)
+                for value in (True, False)
+            }
+        else:
+            trait_dist = {True: int(trait), False: int(not trait)}
+
+        probabilities[person] = {"gene": gene, "trait": trait_dist}
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
+
+def barren_people(people):
     """
-    Return a list of all possible subsets of set s.
+    Return a list of the people whose trait is unknown and who are
+    nobody's parent. Nothing observed depends on them, so they have no
+    effect on anyone else's distribution.
     """
-    s = list(s)
+    parents = set()
+    for person in people:
+        parents.add(people[person]["mother"])
+        parents.add(people[person]["father"])
     return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
-        )
+        person for person in people
+        if people[person]["trait"] is None and person not in parents
     ]
 
 
+def person_factor(people, person):
+    """
+    Return the factor for `person` as a (variables, table) pair.
+    `variables` is the person followed by their parents, if any, and
+    `table` maps each tuple of gene counts for those variables to
+    P(person's genes | parents' genes) * P(observed trait | person's genes).
+    Probabilities are scaled to whole numbers by the same power of SCALE
+    throughout the table, which normalizing cancels out.
+    """
+    mother = people[person]["mother"]
+    father = people[person]["father"]
+    trait = people[person]["trait"]
+
+    def evidence(genes):
+        return 1 if trait is None else TRAIT_SCALED[genes][trait]
+
+    if mother is None:
+        table = {
+            (genes,): PRIOR_SCALED[genes] * evidence(genes)
+            for genes in (0, 1, 2)
+        }
+        return (person,), table
+
+    table = dict()
+    for mother_genes, father_genes in itertools.product((0, 1, 2), repeat=2):
+        inherit = INHERIT_SCALED[mother_genes][father_genes]
+        for genes in (0, 1, 2):
+            table[(genes, mother_genes, father_genes)] = (
+                inherit[genes] * evidence(genes)
+            )
+    return (person, mother, father), table
+
+
+def eliminate(factors, variable):
+    """
+    Multiply together every factor mentioning `variable`, sum `variable`
+    out of the product, and return the new list of factors.
+    """
+    related = [factor for factor in factors if variable in factor[0]]
+    factors = [factor for factor in factors if variable not in factor[0]]
+
+    scope = factor_scope(related, variable)
+
+    table = dict()
+    for assignment in itertools.product((0, 1, 2), repeat=len(scope)):
+        values = dict(zip(scope, assignment))
+        total = 0
+        for genes in (0, 1, 2):
+            values[variable] = genes
+            p = 1
+            for variables, factor_table in related:
+                p *= factor_table[tuple(values[v] for v in variables)]
+            total += p
+        table[assignment] = total
+
+    factors.append((tuple(scope), table))
+    return factors
+
+
+def factor_scope(factors, variable):
+    """
+    Return the variables, other than `variable`, that share a factor
+    with `variable` in `factors`.
+    """
+    scope = []
+    for variables, _ in factors:
+        if variable in variables:
+            for v in variables:
+                if v != variable and v not in scope:
+                    scope.append(v)
+    return scope
+
+
+def powerset(n):
+    """
+    Return every subset of n people, each as a bitmask over their positions.
+    """
+    return range(1 << n)
+
+
+def submasks(mask):
+    """
+    Yield every subset of the bitmask `mask`, including `mask` itself and 0.
+    """
+    sub = mask
+    while True:
+        yield sub
+        if sub == 0:
+            break
+        sub = (sub - 1) & mask
+
+
 def joint_probability(people, one_gene, two_genes, have_trait):
     """
-    Compute and return a joint probability FOR A SINGLE PERSON, NOT A GRUOP OF TARGETS.
+    Compute and return a joint probability.
 
     The probability returned should be the probability that
         * everyone in set `one_gene` has one copy of the gene, and
@@ -138,63 +502,104 @@ def joint_probability(people, one_gene, two_genes, have_trait):
         * everyone not in `one_gene` or `two_gene` does not have the gene, and
         * everyone in set `have_trait` has the trait, and
         * everyone not in set` have_trait` does not have the trait.
+
+    Not used by `main`; kept for the assignment interface, together with
+    `update` and `normalize`.
     """
-    probabilites = []
+    join_prob = 1
     for person in people:
-        person_prob = 1
         person_genes = (2 if person in two_genes else 1 if person in one_gene else 0)
         person_trait = person in have_trait
-        if person not in one_gene or person not in two_genes:
-            # calculating that they have no copies of the gene.
-            # if no parents listed, then we use unconditional probability table.
-            # each parent passes some number of genes randomly. it can be 0,1,2
-            if not people[person]["mother"] is None or not people[person]["father"] is None:
-                mother = people[person]["mother"]
-                father = people[person]["father"]
-                if not mother == None:
-                    if mother in one_gene:
-                        from_mother = 0.5
-                    elif mother in two_genes:
-                        from_mother = 1 - PROBS["mutation"]
-                    else:
-                        from_mother = PROBS["mutation"]
-
-                if not father == None:
-                    if father in one_gene:
-                        from_father = 0.5
-                    elif father in two_genes:
-                        from_father = 1 - PROBS["mutation"]
-                    else:
-                        from_father = PROBS["mutation"]
-
-                if person_genes == 2:
-                    person_prob *= from_mother * from_father
-                elif person_genes == 1: # we are calucalting the prob that mother or father wont pass a gene because genes == 1
-                    person_prob *= (1-from_mother) * from_father + (1-from_father) * from_mother
-                else:
-                    person_prob *=(1-from_mother)*(1-from_father)
-
-                print(f"Here is the probability of the having gene: {person_prob} * {PROBS['trait'][person_genes][person_trait]}, from {person}")
-                probabilites.append(person_prob * PROBS['trait'][person_genes][person_trait])
-            
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+
+        # if no parents listed, then we use unconditional probability table.
+        # each parent passes some number of genes randomly. it can be 0,1,2
+        if mother is not None and father is not None:
+            from_mother = PASS[(mother in one_gene) + 2 * (mother in two_genes)]
+            from_father = PASS[(father in one_gene) + 2 * (father in two_genes)]
+
+            if person_genes == 2:
+                join_prob *= from_mother * from_father
+            elif person_genes == 1: # we are calucalting the prob that mother or father wont pass a gene because genes == 1
+                join_prob *= (1-from_mother) * from_father + (1-from_father) * from_mother
             else:
-                person_prob *= PROBS["gene"][person_genes] * PROBS["trait"][person_genes][person_trait]
-                
-                probabilites.append(person_prob)
-    join_prob = 1
-    
-    for prob in probabilites:
-        join_prob *= prob
+                join_prob *= (1-from_mother)*(1-from_father)
+        else:
+            join_prob *= PRIOR[person_genes]
+
+        join_prob *= TRAIT[person_genes][person_trait]
 
-    
     return join_prob
 
+
+def index_people(people):
+    """
+    Return a list of everyone's names, along with lists giving the
+    position of each person's mother and father in that list
+    (-1 if no parents are listed).
+    """
+    order = list(people)
+    position = {person: i for i, person in enumerate(order)}
+    mothers = [position.get(people[person]["mother"], -1) for person in order]
+    fathers = [position.get(people[person]["father"], -1) for person in order]
+    return order, mothers, fathers
+
+
+def evidence_masks(people, order):
+    """
+    Return a pair of bitmasks over positions in `order`: everyone whose
+    trait is known, and everyone known to have the trait. A set of people
+    `have_trait` agrees with the evidence exactly when
+    `have_trait & required_known == required_true`.
+    """
+    required_known = 0
+    required_true = 0
+    for i, person in enumerate(order):
+        trait = people[person]["trait"]
+        if trait is not None:
+            required_known |= 1 << i
+            if trait:
+                required_true |= 1 << i
+    return required_known, required_true
+
+
+def log_gene_probability(mothers, fathers, genes):
+    """
+    Compute the log-probability that everyone has exactly the number of
+    copies of the gene given in `genes`, with everyone identified by
+    position: `genes[i]` is person i's gene count and `mothers[i]`/
+    `fathers[i]` the positions of their parents as returned by
+    `index_people`.
+    """
+    log_p = 0
+    for person_genes, mother, father in zip(genes, mothers, fathers):
+        if mother < 0:
+            log_p += LOG_PRIOR[person_genes]
+        else:
+            log_p += LOG_INHERIT[genes[mother]][genes[father]][person_genes]
+    return log_p
+
+
+def log_trait_probability(genes, traits):
+    """
+    Compute the log-probability that everyone has the trait exactly when
+    `traits[i]` is set, given that person i has `genes[i]` copies of the gene.
+    """
+    log_p = 0
+    for person_genes, person_trait in zip(genes, traits):
+        log_p += LOG_TRAIT[person_genes][person_trait]
+    return log_p
+
+
 def update(probabilities, one_gene, two_genes, have_trait, p):
     """
     Add to `probabilities` a new joint probability `p`.
     Each person should have their "gene" and "trait" distributions updated.
     Which value for each distribution is updated depends on whether
     the person is in `have_gene` and `have_trait`, respectively.
+
+    Not used by `main`; kept for the assignment interface.
     """
     for person in probabilities:
         if person in one_gene:
@@ -206,7 +611,6 @@ def update(probabilities, one_gene, two_genes, have_trait, p):
 
 
         if person in have_trait:
-            print("has trait " + person)
             probabilities[person]["trait"][True] += p
         elif person not in have_trait:
             probabilities[person]["trait"][False] += p
@@ -219,29 +623,11 @@ def normalize(probabilities):
     is normalized (i.e., sums to 1, with relative proportions the same).
     """
     for person in probabilities:
-
-        # normalizing trait probabilites.
-        trait_true = probabilities[person]["trait"][True]
-        trait_false = probabilities[person]["trait"][False]
-        summary = trait_false + trait_true
-
-        if summary != 1.0:
+        for distribution in probabilities[person].values():
             #some_value / sum of values. thats how we normalize prob distribution
-            probabilities[person]["trait"][True] /= summary
-            probabilities[person]["trait"][False] /= summary
-
-        no_genes = probabilities[person]["gene"][0]
-        one_gene = probabilities[person]["gene"][1]
-        two_genes = probabilities[person]["gene"][2]
-
-        summary_genes = no_genes + one_gene + two_genes
-
-        if summary_genes !=1.0:
-            probabilities[person]["gene"][0] /= summary_genes
-            probabilities[person]["gene"][1] /= summary_genes
-            probabilities[person]["gene"][2] /= summary_genes
-
-            
+            total = sum(distribution.values())
+            for value in distribution:
+                distribution[value] /= total
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+import csv
+import glob
+import os
+import tempfile
+import types
+import unittest
+
+import heredity
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def load(name):
+    return heredity.load_data(os.path.join(DATA, name))
+
+
+def heredity_with_mutation(mutation):
+    """
+    Return a fresh copy of the heredity module with PROBS["mutation"]
+    set to `mutation`, since the lookup tables are built at import.
+    """
+    with open(heredity.__file__) as f:
+        source = f.read()
+    old = f'"mutation": {heredity.PROBS["mutation"]!r}'
+    assert old in source
+    source = source.replace(old, f'"mutation": {mutation!r}')
+    module = types.ModuleType("heredity_mutation")
+    module.__file__ = heredity.__file__
+    exec(compile(source, heredity.__file__, "exec"), module.__dict__)
+    return module
+
+
+class TestHeredity(unittest.TestCase):
+
+    def assertSameProbabilities(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for person in first:
+            for field in ("gene", "trait"):
+                for value, p in first[person][field].items():
+                    self.assertAlmostEqual(
+                        p, second[person][field][value], places=12,
+                        msg=f"{person} {field} {value}"
+                    )
+
+    def test_load_data_matches_dict_reader(self):
+        # A short row and a trailing blank line, as in hand-edited files
+        text = "name,mother,father,trait\nA,,,1\nB,,,0\nC\nD,A,B,\n\n"
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "family.csv")
+            with open(filename, "w") as f:
+                f.write(text)
+            self.assertEqual(
+                heredity.load_data(filename), load_with_dict_reader(filename)
+            )
+
+    def test_variable_elimination_matches_enumeration(self):
+        for filename in sorted(glob.glob(os.path.join(DATA, "*.csv"))):
+            with self.subTest(filename=filename):
+                people = heredity.load_data(filename)
+                self.assertSameProbabilities(
+                    heredity.variable_elimination(people),
+                    heredity.enumeration(people, workers=1)
+                )
+
+    def test_enumeration_workers(self):
+        for filename in sorted(glob.glob(os.path.join(DATA, "*.csv"))):
+            with self.subTest(filename=filename):
+                people = heredity.load_data(filename)
+                self.assertSameProbabilities(
+                    heredity.enumeration(people, workers=2),
+                    heredity.enumeration(people, workers=1)
+                )
+
+    def test_family0_harry(self):
+        probabilities = heredity.variable_elimination(load("family0.csv"))
+        gene = probabilities["Harry"]["gene"]
+        self.assertEqual(round(gene[2], 4), 0.0092)
+        self.assertEqual(round(gene[1], 4), 0.4557)
+        self.assertEqual(round(gene[0], 4), 0.5351)
+
+    def test_joint_probability(self):
+        p = heredity.joint_probability(
+            load("family0.csv"), {"Harry"}, {"James"}, {"James"}
+        )
+        self.assertAlmostEqual(p, 0.0026643247488, places=15)
+
+    def test_assignment_functions_match_variable_elimination(self):
+        for filename in sorted(glob.glob(os.path.join(DATA, "*.csv"))):
+            with self.subTest(filename=filename):
+                people = heredity.load_data(filename)
+                self.assertSameProbabilities(
+                    brute_force(people), heredity.variable_elimination(people)
+                )
+
+    def test_barren_people(self):
+        # Carol is barren with parents, Dan is barren without
+        people = {
+            "Alice": row("Alice", None, None, True),
+            "Bob": row("Bob", None, None, False),
+            "Carol": row("Carol", "Alice", "Bob", None),
+            "Dan": row("Dan", None, None, None),
+            "Eve": row("Eve", "Alice", "Bob", True)
+        }
+        self.assertEqual(heredity.barren_people(people), ["Carol", "Dan"])
+
+        expected = brute_force(people)
+        self.assertSameProbabilities(
+            heredity.enumeration(people, workers=1), expected
+        )
+        self.assertSameProbabilities(
+            heredity.variable_elimination(people), expected
+        )
+
+    def test_exact_arithmetic_with_finer_probabilities(self):
+        module = heredity_with_mutation(0.005)
+        self.assertEqual(module.SCALE, 200)
+        for filename in sorted(glob.glob(os.path.join(DATA, "*.csv"))):
+            with self.subTest(filename=filename):
+                people = module.load_data(filename)
+                self.assertSameProbabilities(
+                    module.variable_elimination(people),
+                    module.enumeration(people, workers=1)
+                )
+
+    def test_zero_mutation(self):
+        module = heredity_with_mutation(0)
+        people = module.load_data(os.path.join(DATA, "family0.csv"))
+        for probabilities in (
+            module.variable_elimination(people),
+            module.enumeration(people, workers=1)
+        ):
+            gene = probabilities["Harry"]["gene"]
+            self.assertEqual(round(gene[2], 4), 0.0047)
+            self.assertEqual(round(gene[1], 4), 0.4539)
+            self.assertEqual(round(gene[0], 4), 0.5414)
+
+
+def load_with_dict_reader(filename):
+    """
+    Load a CSV the way `load_data` did with csv.DictReader.
+    """
+    data = dict()
+    with open(filename) as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            name = row["name"]
+            data[name] = {
+                "name": name,
+                "mother": row["mother"] or None,
+                "father": row["father"] or None,
+                "trait": (True if row["trait"] == "1" else
+                          False if row["trait"] == "0" else None)
+            }
+    return data
+
+
+def row(name, mother, father, trait):
+    return {"name": name, "mother": mother, "father": father, "trait": trait}
+
+
+def brute_force(people):
+    """
+    Compute gene and trait distributions with the assignment functions,
+    summing `joint_probability` over every assignment consistent with
+    the known traits.
+    """
+    probabilities = {
+        person: {
+            "gene": {2: 0, 1: 0, 0: 0},
+            "trait": {True: 0, False: 0}
+        }
+        for person in people
+    }
+
+    names = set(people)
+    known_true = {p for p in names if people[p]["trait"] is True}
+    unknown = {p for p in names if people[p]["trait"] is None}
+    for ht_sub in subsets(unknown):
+        have_trait = known_true | ht_sub
+        for one_gene in subsets(names):
+            for two_genes in subsets(names - one_gene):
+                p = heredity.joint_probability(
+                    people, one_gene, two_genes, have_trait
+                )
+                heredity.update(probabilities, one_gene, two_genes, have_trait, p)
+    heredity.normalize(probabilities)
+    return probabilities
+
+
+def subsets(s):
+    """
+    Yield every subset of set `s` as a set.
+    """
+    s = list(s)
+    for mask in heredity.powerset(len(s)):
+        yield {person for i, person in enumerate(s) if mask >> i & 1}
+
+
+if __name__ == "__main__":
+    unittest.main()